@@ -0,0 +1,17 @@
+/*
+    Identifies the tab sending the callback requests (X-Dash-Tab header, see background.py)
+    A new id is drawn every time the page is loaded, so two tabs never share one
+*/
+(function () {
+    var bytes = new Uint8Array(16);
+    window.crypto.getRandomValues(bytes);
+    var tabId = Array.from(bytes, function (byte) { return byte.toString(16).padStart(2, "0"); }).join("");
+    var fetch = window.fetch;
+    window.fetch = function (resource, init) {
+        init = Object.assign({}, init);
+        var headers = new Headers(init.headers);
+        headers.set("X-Dash-Tab", tabId);
+        init.headers = headers;
+        return fetch.call(this, resource, init);
+    };
+})();
@@ -0,0 +1,123 @@
+"""
+    Background execution of the expensive callbacks
+
+    The decorated callbacks run on a local thread pool. Identical requests arriving
+    while a computation is running (same callback, player and variant) wait for
+    that computation instead of starting their own. When a browser tab asks for another
+    player before the previous figure is ready, the previous request is answered
+    with PreventUpdate and its computation is cancelled if it has not started yet
+"""
+import functools
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+
+import flask
+from dash.exceptions import PreventUpdate
+
+CLIENT_HEADER = "X-Dash-Tab"  # set on every request by assets/tab_id.js
+
+
+def hashable(value):
+    """
+        Lists (e.g. checklist values) are turned into tuples so that the arguments can be used as a key
+    """
+    return tuple(hashable(item) for item in value) if isinstance(value, (list, tuple)) else value
+
+
+def get_client_id():
+    """
+        Identifies the browser tab sending the current request, None outside of a request or without the header
+        A cookie would be shared by the tabs of a browser, one tab would make the requests of the others stale
+    """
+    if not flask.has_request_context():
+        return None
+    return flask.request.headers.get(CLIENT_HEADER)
+
+
+class CoalescingExecutor:
+    """
+        Thread pool running callbacks with request coalescing and cancellation of stale requests
+        The first argument of a callback is the selection (the player), the other ones are its variant
+    """
+    def __init__(self, max_workers=4, enabled=True):
+        self.enabled = enabled
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="background")
+        self.lock = threading.RLock()  # cancelling a future runs its done callback in the same thread
+        self.in_flight = {}  # (callback, args): {"future", "waiters"}
+        self.latest = {}  # (client, callback, variant): (in_flight entry, superseded future) of the last request
+        self.stats = {"computed": 0, "coalesced": 0, "stale": 0, "cancelled": 0, "resubmitted": 0}
+
+    def background(self, func):
+        """
+            Decorator running a callback through the executor
+        """
+        @functools.wraps(func)
+        def wrapper(*args):
+            if not self.enabled:
+                return func(*args)
+            return self.call(func, args, get_client_id())
+        return wrapper
+
+    def call(self, func, args, client=None):
+        """
+            Returns func(*args), computed in the pool or shared with an identical running request
+            Raises PreventUpdate if the client made a newer request for the same callback and variant
+        """
+        key = (func.__name__, hashable(args))
+        slot = (client, func.__name__, hashable(args[1:]))
+        superseded = Future()
+        with self.lock:
+            entry = self._join(func, args, key)
+            if client is not None:
+                previous = self.latest.get(slot)
+                self.latest[slot] = (entry, superseded)
+                if previous is not None:
+                    previous_entry, previous_superseded = previous
+                    previous_superseded.set_result(True)
+                    self._leave(previous_entry)
+
+        while True:
+            wait([entry["future"], superseded], return_when=FIRST_COMPLETED)
+            with self.lock:
+                if superseded.done():  # the waiter count was decreased by the newer request
+                    self.stats["stale"] += 1
+                    raise PreventUpdate
+                if not entry["future"].cancelled():
+                    self._leave(entry)
+                    if client is not None and self.latest.get(slot, (None, None))[1] is superseded:
+                        del self.latest[slot]
+                    break
+                # should not happen, the computation was cancelled while this request waited for it
+                self.stats["resubmitted"] += 1
+                entry = self._join(func, args, key)
+                if client is not None and self.latest.get(slot, (None, None))[1] is superseded:
+                    self.latest[slot] = (entry, superseded)
+        return entry["future"].result()
+
+    def _join(self, func, args, key):
+        """
+            Adds a waiter to the running computation of key, submitting it if there is none
+        """
+        entry = self.in_flight.get(key)
+        if entry is None:
+            entry = self.in_flight[key] = {"future": self.executor.submit(func, *args), "waiters": 0}
+            entry["future"].add_done_callback(functools.partial(self._done, key))
+            self.stats["computed"] += 1
+        else:
+            self.stats["coalesced"] += 1
+        entry["waiters"] += 1
+        return entry
+
+    def _leave(self, entry):
+        """
+            A request stops waiting for entry, the computation is cancelled if nobody waits for it anymore
+            The entry itself is given, not its key: the key may already belong to a newer computation
+        """
+        entry["waiters"] -= 1
+        if entry["waiters"] == 0 and entry["future"].cancel():
+            self.stats["cancelled"] += 1
+
+    def _done(self, key, future):
+        with self.lock:
+            if key in self.in_flight and self.in_flight[key]["future"] is future:
+                del self.in_flight[key]
@@ -0,0 +1,237 @@
+"""
+    Memory diagnostics of the dashboard
+
+    Reports the deep memory usage of every table of all_df (and of every column),
+    of the registered caches, and the allocations made by a single callback call.
+    Served under /_diagnostics/ when main.py runs with --diagnostics (or DIAGNOSTICS=1)
+
+    python diagnostics.py memory [--columns 20] [--json]
+    python diagnostics.py allocations plot_gk "Player Name" saves [--top 10] [--json]
+"""
+import argparse
+import inspect
+import json
+import sys
+import threading
+import tracemalloc
+
+# functions of main.py that are not callbacks but can be profiled, plot_gk draws the figures of the keeper callbacks
+PROFILED_FUNCTIONS = {"plot_gk"}
+# tracemalloc is process wide: a profile stopping it would break the snapshots of another one
+PROFILE_LOCK = threading.Lock()
+
+# name: object or function returning it, other memory holders (caches, indexes) included in the memory report
+CACHES = {}
+
+
+def register_cache(name, obj):
+    """
+        Adds an object to the memory report
+        A cache modified by other threads is registered as a function returning a copy taken under its lock
+    """
+    CACHES[name] = obj
+
+
+def deep_getsizeof(obj, seen=None):
+    """
+        Size of an object and of everything it contains, dataframes are measured with memory_usage(deep=True)
+    """
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    if hasattr(obj, "memory_usage"):  # dataframes and series
+        usage = obj.memory_usage(deep=True)
+        return int(usage.sum()) if hasattr(usage, "sum") else int(usage)
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_getsizeof(key, seen) + deep_getsizeof(value, seen) for key, value in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_getsizeof(item, seen) for item in obj)
+    elif hasattr(obj, "__dict__"):
+        size += deep_getsizeof(vars(obj), seen)
+    return size
+
+
+def memory_report(all_df, load=False):
+    """
+        Returns the deep memory usage of every loaded table and column of all_df and of the registered caches
+        The tables that are not loaded yet are listed as pending, unless load is True
+    """
+    if load:
+        all_df.load_all()
+    pending = all_df.pending()
+    tables, columns = [], []
+    for name in all_df:
+        if name in pending:
+            continue
+        df = all_df[name]
+        usage = df.memory_usage(deep=True)
+        tables.append({"table": name, "derived": name in all_df.builders, "rows": len(df), "bytes": int(usage.sum())})
+        for column, size in usage.items():
+            dtype = "index" if column == "Index" else str(df[column].dtype)
+            columns.append({"table": name, "column": str(column), "dtype": dtype, "bytes": int(size)})
+    caches = [
+        {"cache": name, "bytes": deep_getsizeof(obj() if callable(obj) else obj)} for name, obj in list(CACHES.items())
+    ]
+    return {
+        "total_bytes": sum(table["bytes"] for table in tables) + sum(cache["bytes"] for cache in caches),
+        "tables": sorted(tables, key=lambda table: -table["bytes"]),
+        "columns": sorted(columns, key=lambda column: -column["bytes"]),
+        "caches": caches,
+        "pending": pending,
+    }
+
+
+def profile_allocations(func, *args, top=10):
+    """
+        Calls func(*args) while tracing the allocations
+        Returns the result, the peak of traced memory during the call and the top allocation sites
+        of the memory still allocated after the call.
+        tracemalloc traces the whole process: allocations of other threads are counted too,
+        the profiles run one at a time
+    """
+    with PROFILE_LOCK:
+        was_tracing = tracemalloc.is_tracing()
+        if not was_tracing:
+            tracemalloc.start()
+        ignored = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "<frozen importlib._bootstrap*>")]
+        before = tracemalloc.take_snapshot().filter_traces(ignored)
+        start_size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        try:
+            result = func(*args)
+            _, peak = tracemalloc.get_traced_memory()
+            after = tracemalloc.take_snapshot().filter_traces(ignored)
+        finally:
+            if not was_tracing:
+                tracemalloc.stop()
+    sites = [
+        {"site": str(stat.traceback[0]), "bytes": stat.size_diff, "count": stat.count_diff}
+        for stat in after.compare_to(before, "lineno")[:top]
+    ]
+    return result, {"peak_bytes": peak - start_size, "top": sites}
+
+
+def get_callback(app, module, name):
+    """
+        Returns the undecorated function of the callback called name, or the function name of module
+        if it is one of PROFILED_FUNCTIONS. Any other name raises a ValueError
+    """
+    for callback in app.callback_map.values():
+        func = getattr(callback["callback"], "__wrapped__", None)
+        if func is not None and func.__name__ == name:
+            return func
+    func = getattr(module, name, None)
+    if name not in PROFILED_FUNCTIONS or not callable(func):
+        raise ValueError(f"{name} is not a callback")
+    return func
+
+
+def check_arguments(func, args):
+    """
+        Raises a ValueError if func cannot be called with args
+    """
+    try:
+        inspect.signature(func).bind(*args)
+    except TypeError as error:
+        raise ValueError(f"{func.__name__}: {error}") from None
+
+
+def add_routes(app, all_df, module):
+    """
+        Serves the memory report and the allocation profiles:
+        /_diagnostics/memory?load=1
+        /_diagnostics/allocations?callback=plot_gk&arg=Player Name&arg=saves&top=10
+    """
+    import flask
+
+    @app.server.route("/_diagnostics/memory")
+    def diagnostics_memory():
+        return flask.jsonify(memory_report(all_df, load=flask.request.args.get("load") == "1"))
+
+    @app.server.route("/_diagnostics/allocations")
+    def diagnostics_allocations():
+        try:
+            func = get_callback(app, module, flask.request.args.get("callback", ""))
+        except ValueError as error:
+            return flask.jsonify({"error": str(error)}), 404
+        try:
+            top = int(flask.request.args.get("top", 10))
+        except ValueError:
+            return flask.jsonify({"error": "top must be an integer"}), 400
+        args = flask.request.args.getlist("arg")
+        try:
+            check_arguments(func, args)
+            _, profile = profile_allocations(func, *args, top=top)
+        except ValueError as error:  # wrong number of arguments or unknown player
+            return flask.jsonify({"error": str(error)}), 400
+        return flask.jsonify(profile)
+
+
+def format_bytes(size):
+    for unit in ("B", "KB", "MB"):
+        if abs(size) < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+
+def print_memory_report(report, columns):
+    print(f"Total: {format_bytes(report['total_bytes'])}")
+    print(f"{'table':<26}{'rows':>9}{'memory':>12}")
+    for table in report["tables"]:
+        derived = " (derived)" if table["derived"] else ""
+        print(f"{table['table']:<26}{table['rows']:>9}{format_bytes(table['bytes']):>12}{derived}")
+    for cache in report["caches"]:
+        print(f"{cache['cache']:<26}{'':>9}{format_bytes(cache['bytes']):>12} (cache)")
+    if report["pending"]:
+        print(f"Not loaded: {', '.join(report['pending'])}")
+    print("\nLargest columns")
+    for column in report["columns"][:columns]:
+        print(f"{column['table'] + '.' + column['column']:<50}{column['dtype']:>10}{format_bytes(column['bytes']):>12}")
+
+
+def print_profile(name, profile):
+    print(f"{name}: peak {format_bytes(profile['peak_bytes'])} during the call")
+    print(f"{'still allocated':>16}{'blocks':>9}  site")
+    for site in profile["top"]:
+        print(f"{format_bytes(site['bytes']):>16}{site['count']:>9}  {site['site']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory diagnostics of the dashboard")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    memory = subparsers.add_parser("memory", help="memory usage of every table, column and cache")
+    memory.add_argument("--columns", type=int, default=20, help="number of columns listed")
+    memory.add_argument("--json", action="store_true")
+    allocations = subparsers.add_parser("allocations", help="top allocation sites of one callback call")
+    allocations.add_argument("callback", help="callback name, e.g. plot_gk or get_player_assists")
+    allocations.add_argument("args", nargs="*", help="callback arguments, e.g. the player name")
+    allocations.add_argument("--top", type=int, default=10)
+    allocations.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    import main as dashboard
+
+    if args.command == "memory":
+        report = memory_report(dashboard.all_df, load=True)
+        if args.json:
+            print(json.dumps(report, indent=2))
+        else:
+            print_memory_report(report, args.columns)
+    else:
+        try:
+            func = get_callback(dashboard.app, dashboard, args.callback)
+            check_arguments(func, args.args)
+            _, profile = profile_allocations(func, *args.args, top=args.top)
+        except ValueError as error:
+            parser.error(str(error))
+        if args.json:
+            print(json.dumps(profile, indent=2))
+        else:
+            print_profile(args.callback, profile)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,428 @@
+"""
+    Load generator for the dashboard callbacks
+
+    Every simulated user opens a position page (display_page), lists the players
+    of the position (update_dropdowns) and picks a few players, each pick firing
+    every callback of the page that depends on the player (figures, sidebar).
+    The requests go through the Flask test client, or to a running server with --url
+
+    python loadtest.py --clients 8 --sessions 20 --popularity zipf
+    python loadtest.py --url http://127.0.0.1:8050 --clients 16 --sessions 50
+    python loadtest.py --check --clients 16  # parallel callbacks and responses must match sequential ones
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+PAGES = ["/keeper", "/defender", "/midfielder", "/striker"]
+DISPLAY_PAGE = "page-content"
+UPDATE_DROPDOWNS = "player_dropdown"
+TAB_HEADER = "X-Dash-Tab"  # identifies the browser tab, set by assets/tab_id.js in a browser
+
+
+class TestClientTransport:
+    """
+        Sends the requests to the app of main.py through the Flask test client, as one browser tab
+    """
+    def __init__(self):
+        from main import app
+        self.client = app.server.test_client()
+        self.headers = {TAB_HEADER: uuid.uuid4().hex}
+
+    def request(self, path, body=None):
+        if body is None:
+            response = self.client.get(path, headers=self.headers)
+        else:
+            response = self.client.post(path, json=body, headers=self.headers)
+        return response.status_code, response.get_json(silent=True)
+
+
+class HttpTransport:
+    """
+        Sends the requests to a running server, as one browser tab
+    """
+    def __init__(self, url):
+        self.url = url.rstrip("/")
+        self.headers = {"Content-Type": "application/json", TAB_HEADER: uuid.uuid4().hex}
+
+    def request(self, path, body=None):
+        data = None if body is None else json.dumps(body).encode()
+        request = urllib.request.Request(self.url + path, data=data, headers=self.headers)
+        try:
+            with urllib.request.urlopen(request) as response:
+                content = response.read()
+                return response.status, json.loads(content) if content else None
+        except urllib.error.HTTPError as error:
+            return error.code, None
+
+
+def split_output(output):
+    """
+        Returns the (id, property) pairs of a callback output string
+    """
+    if output.startswith(".."):  # multiple outputs: "..id.prop...id.prop.."
+        return [tuple(part.rsplit(".", 1)) for part in output[2:-2].split("...")]
+    return [tuple(output.rsplit(".", 1))]
+
+
+def callback_name(callback):
+    """
+        Names a callback after its first output component
+    """
+    return split_output(callback["output"])[0][0]
+
+
+def build_body(callback, values, changed):
+    """
+        Builds the body of a _dash-update-component request
+        values maps "id.property" to the current value of the components
+    """
+    outputs = [{"id": component, "property": prop} for component, prop in split_output(callback["output"])]
+    return {
+        "output": callback["output"],
+        "outputs": outputs if callback["output"].startswith("..") else outputs[0],
+        "inputs": [dict(item, value=values.get(f"{item['id']}.{item['property']}")) for item in callback["inputs"]],
+        "state": [dict(item, value=values.get(f"{item['id']}.{item['property']}")) for item in callback["state"]],
+        "changedPropIds": [changed],
+    }
+
+
+def get_layout_values(layout, values=None):
+    """
+        Walks a serialized layout and returns {"id.property": value} for every component with an id
+    """
+    values = {} if values is None else values
+    if isinstance(layout, list):
+        for child in layout:
+            get_layout_values(child, values)
+    elif isinstance(layout, dict) and "props" in layout:
+        props = layout["props"]
+        if "id" in props:
+            for prop, value in props.items():
+                if prop != "children":
+                    values[f"{props['id']}.{prop}"] = value
+            values.setdefault(f"{props['id']}.children", None)
+        get_layout_values(props.get("children"), values)
+    return values
+
+
+class Stats:
+    """
+        Thread-safe latency and error recorder, one entry per callback
+        Prevented updates (204, stale requests of --background) are counted apart from the latencies
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+        self.prevented = {}
+
+    def record(self, name, latency, ok, prevented=False):
+        with self.lock:
+            self.latencies.setdefault(name, [])
+            self.errors[name] = self.errors.get(name, 0) + (not ok)
+            self.prevented[name] = self.prevented.get(name, 0) + prevented
+            if not prevented:
+                self.latencies[name].append(latency)
+
+    def report(self, duration):
+        """
+            Returns the throughput, prevented updates, latency percentiles and error rate of every callback as text
+            The latencies and the error rate are those of the requests that were not prevented
+        """
+        def percentile(latencies, pct):
+            return latencies[min(len(latencies) - 1, int(len(latencies) * pct / 100))] * 1000
+
+        total = sum(len(latencies) for latencies in self.latencies.values())
+        prevented = sum(self.prevented.values())
+        lines = [
+            f"{total} requests in {duration:.2f}s ({total / duration:.1f} req/s), {sum(self.errors.values())} errors, "
+            f"{prevented} prevented updates (204)",
+            f"{'callback':<34}{'count':>7}{'req/s':>8}{'204':>7}{'err %':>7}{'mean':>9}{'p50':>9}{'p90':>9}{'p99':>9}{'max':>9}  (ms)",
+        ]
+        for name, latencies in sorted(self.latencies.items()):
+            latencies = sorted(latencies)
+            line = f"{name:<34}{len(latencies):>7}{len(latencies) / duration:>8.1f}{self.prevented[name]:>7}"
+            if latencies:
+                line += (
+                    f"{100 * self.errors[name] / len(latencies):>7.1f}{1000 * sum(latencies) / len(latencies):>9.1f}"
+                    f"{percentile(latencies, 50):>9.1f}{percentile(latencies, 90):>9.1f}"
+                    f"{percentile(latencies, 99):>9.1f}{latencies[-1] * 1000:>9.1f}"
+                )
+            lines.append(line)
+        return "\n".join(lines)
+
+
+class PlayerPicker:
+    """
+        Picks players following the popularity distribution
+        With zipf, the players are ranked once per list (shuffled with the seed) and
+        the player of rank r is picked with a probability proportional to 1 / r^s
+    """
+    def __init__(self, popularity, zipf_s, seed):
+        self.popularity = popularity
+        self.zipf_s = zipf_s
+        self.seed = seed
+        self.lock = threading.Lock()
+        self.rankings = {}
+
+    def pick(self, players, rng):
+        if self.popularity == "uniform":
+            return rng.choice(players)
+        key = tuple(players)
+        with self.lock:
+            if key not in self.rankings:
+                ranked = list(players)
+                random.Random(self.seed).shuffle(ranked)
+                self.rankings[key] = (ranked, [1 / rank ** self.zipf_s for rank in range(1, len(ranked) + 1)])
+        ranked, weights = self.rankings[key]
+        return rng.choices(ranked, weights)[0]
+
+
+class Client:
+    """
+        A simulated user replaying the callbacks the browser sends
+    """
+    def __init__(self, transport, callbacks, stats, picker, args, seed):
+        self.transport = transport
+        self.callbacks = callbacks
+        self.stats = stats
+        self.picker = picker
+        self.args = args
+        self.rng = random.Random(seed)
+
+    def call(self, callback, values, changed):
+        """
+            Fires a callback, records its latency and returns its outputs as {"id.property": value}
+        """
+        start = time.perf_counter()
+        try:
+            status, payload = self.transport.request("/_dash-update-component", build_body(callback, values, changed))
+        except Exception:
+            status, payload = None, None
+        # 204: the callback prevented the update, e.g. a stale request answered at once in --background mode
+        self.stats.record(callback_name(callback), time.perf_counter() - start, status in (200, 204), status == 204)
+        if self.args.think:
+            time.sleep(self.rng.expovariate(1 / self.args.think))
+        outputs = {}
+        for component, props in ((payload or {}).get("response") or {}).items():
+            for prop, value in props.items():
+                outputs[f"{component}.{prop}"] = value
+        return outputs
+
+    def open_page(self, page):
+        """
+            Opens a position page with every position selected
+            Returns the values of the page components, the players and the callbacks fired when a player is picked
+        """
+        layout = self.call(self.callbacks[DISPLAY_PAGE], {"url.pathname": page}, "url.pathname")
+        values = get_layout_values(layout.get("page-content.children"))
+        values.update(self.call(self.callbacks[UPDATE_DROPDOWNS], values, "position_dropdown.value"))
+        player_callbacks = [
+            callback for name, callback in self.callbacks.items()
+            if any(item["id"] == "player_dropdown" and item["property"] == "value" for item in callback["inputs"])
+            and all(f"{item['id']}.{item['property']}" in values for item in callback["inputs"])
+            and all(f"{component}.id" in values for component, _ in split_output(callback["output"]))
+        ]
+        return values, values.get("player_dropdown.options") or [], player_callbacks
+
+    def run_session(self):
+        values, players, player_callbacks = self.open_page(self.rng.choice(PAGES))
+        if not players:
+            return
+        for _ in range(self.args.picks):
+            values["player_dropdown.value"] = self.picker.pick(players, self.rng)
+            values["overlay_toggle.value"] = ["percentiles"] if self.rng.random() < self.args.overlay_rate else []
+            for callback in player_callbacks:
+                self.call(callback, values, "player_dropdown.value")
+
+    def run(self, sessions):
+        for _ in range(sessions):
+            self.run_session()
+
+
+def make_transport(args):
+    return HttpTransport(args.url) if args.url else TestClientTransport()
+
+
+def get_callbacks(transport):
+    """
+        Returns the callbacks of the app, by name
+    """
+    status, dependencies = transport.request("/_dash-dependencies")
+    if status != 200:
+        raise SystemExit(f"Could not get the callbacks of the app (status {status})")
+    return {callback_name(callback): callback for callback in dependencies}
+
+
+def run_load_test(args):
+    """
+        Runs args.clients concurrent clients of args.sessions sessions each, returns the stats and the duration
+    """
+    callbacks = get_callbacks(make_transport(args))
+    stats = Stats()
+    picker = PlayerPicker(args.popularity, args.zipf_s, args.seed)
+    clients = [
+        Client(make_transport(args), callbacks, stats, picker, args, args.seed + i)
+        for i in range(args.clients)
+    ]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.clients) as executor:
+        for future in [executor.submit(client.run, args.sessions) for client in clients]:
+            future.result()
+    return stats, time.perf_counter() - start
+
+
+def run_concurrency_check(args):
+    """
+        Fires the player callbacks of args.picks players of every page once sequentially,
+        then replays them args.sessions times in a shuffled order from args.clients threads.
+        A parallel response that differs from the sequential one is counted as an error
+    """
+    transport = make_transport(args)
+    client = Client(transport, get_callbacks(transport), Stats(), None, args, args.seed)
+    requests = []
+    for page in PAGES:
+        values, players, player_callbacks = client.open_page(page)
+        for player in client.rng.sample(list(players), min(args.picks, len(players))):
+            for overlays in ([], ["percentiles"]):
+                player_values = dict(values, **{"player_dropdown.value": player, "overlay_toggle.value": overlays})
+                for callback in player_callbacks:
+                    body = build_body(callback, player_values, "player_dropdown.value")
+                    requests.append((callback_name(callback), body, transport.request("/_dash-update-component", body)))
+    replays = requests * args.sessions
+    client.rng.shuffle(replays)
+
+    stats = Stats()
+    local = threading.local()
+
+    def replay(request):
+        name, body, expected = request
+        if not hasattr(local, "transport"):
+            local.transport = make_transport(args)
+        start = time.perf_counter()
+        response = local.transport.request("/_dash-update-component", body)
+        stats.record(name, time.perf_counter() - start, response == expected and expected[0] in (200, 204))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.clients) as executor:
+        list(executor.map(replay, replays))
+    return stats, time.perf_counter() - start
+
+
+def run_callback_check(args):
+    """
+        Calls the undecorated callbacks of main.py directly from args.clients threads, all the calls
+        sharing the same input objects (e.g. the options list given to update_dropdowns).
+        A result that differs from the sequential one is counted as an error.
+        Returns the stats, the duration and the names of the inputs and tables modified by the callbacks
+    """
+    import copy
+    import inspect
+    import plotly
+    import main as dashboard
+
+    dashboard.all_df.load_all()
+    info = dashboard.all_df["info"]
+    rng = random.Random(args.seed)
+    shared = {
+        "position_dropdown.options": ["All"] + sorted(info["general_position"].dropna().unique().tolist()),
+        "overlay_toggle.value": ["percentiles"],
+        "compare_players.value": rng.sample(info["name"].tolist(), min(10, len(info))),
+        "graph_type.value": "ATT",
+        "url.pathname": "/striker",
+    }
+    inputs_before = copy.deepcopy(shared)
+    tables_before = {name: dashboard.all_df[name].copy() for name in dashboard.all_df}
+
+    calls = []
+    for callback in dashboard.app.callback_map.values():
+        func = inspect.unwrap(callback["callback"])
+        keys = [f"{item['id']}.{item['property']}" for item in callback["inputs"] + callback["state"]]
+        if "player_dropdown.value" in keys:
+            for player in rng.sample(info["name"].tolist(), min(args.picks, len(info))):
+                calls.append((func, keys, {"player_dropdown.value": player}))
+        elif "position_dropdown.value" in keys:
+            for position in shared["position_dropdown.options"][:3]:  # "All" and two positions
+                calls.append((func, keys, {"position_dropdown.value": position}))
+        elif all(key in shared for key in keys):
+            calls.append((func, keys, {}))
+
+    def run(call):
+        func, keys, values = call
+        result = func(*[values[key] if key in values else shared[key] for key in keys])
+        return json.dumps(result, cls=plotly.utils.PlotlyJSONEncoder, sort_keys=True)
+
+    expected = []
+    for call in calls:
+        try:
+            expected.append(run(call))
+        except Exception as error:
+            expected.append(error)
+    replays = list(zip(calls, expected)) * args.sessions
+    rng.shuffle(replays)
+
+    stats = Stats()
+
+    def replay(item):
+        call, result = item
+        start = time.perf_counter()
+        try:
+            ok = not isinstance(result, Exception) and run(call) == result
+        except Exception:
+            ok = False
+        stats.record(call[0].__name__, time.perf_counter() - start, ok)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.clients) as executor:
+        list(executor.map(replay, replays))
+    duration = time.perf_counter() - start
+
+    modified = [f"input {key}" for key in shared if shared[key] != inputs_before[key]]
+    modified += [
+        f"table {name}" for name, table in tables_before.items()
+        if not table.equals(dashboard.all_df[name]) or list(table.columns) != list(dashboard.all_df[name].columns)
+    ]
+    return stats, duration, modified
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent load test of the dashboard callbacks")
+    parser.add_argument("--url", help="server to test (e.g. http://127.0.0.1:8050), the Flask test client is used by default")
+    parser.add_argument("--clients", type=int, default=4, help="number of concurrent users")
+    parser.add_argument("--sessions", type=int, default=10, help="sessions per user (page + position + players)")
+    parser.add_argument("--picks", type=int, default=3, help="players picked per session")
+    parser.add_argument("--popularity", choices=["uniform", "zipf"], default="zipf", help="player popularity distribution")
+    parser.add_argument("--zipf-s", type=float, default=1.1, help="zipf exponent, higher means fewer popular players")
+    parser.add_argument("--overlay-rate", type=float, default=0.2, help="share of picks with the percentile overlay")
+    parser.add_argument("--think", type=float, default=0, help="mean think time between requests (seconds)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--check", action="store_true", help="check that callbacks called in parallel match sequential calls and leave their inputs and the tables unchanged (errors are mismatches)")
+    args = parser.parse_args()
+
+    if args.check:
+        stats, duration, modified = run_callback_check(args)
+        print("Callbacks called directly from threads")
+        print(stats.report(duration))
+        if modified:
+            raise SystemExit(f"The callbacks modified shared data: {', '.join(modified)}")
+        if sum(stats.errors.values()):
+            raise SystemExit("Some callbacks called in parallel failed or differ from the sequential ones")
+        stats, duration = run_concurrency_check(args)
+        print("\nRequests replayed in parallel")
+        print(stats.report(duration))
+        if sum(stats.errors.values()):
+            raise SystemExit("Some responses computed in parallel differ from the sequential ones")
+    else:
+        stats, duration = run_load_test(args)
+        print(stats.report(duration))
+
+
+if __name__ == "__main__":
+    main()
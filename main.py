@@ -1,26 +1,68 @@
-import numpy as np
+from utils import time_this, lazy_import, StartupTimer, wait_for_port  # self created utils to time functions
+startup_timer = StartupTimer()
+
 from dash import Dash, html, dcc, Input, Output, callback_context
-import plotly.express as px
-import pandas as pd
-from preprocess import get_all_dataframes
-from utils import time_this  # self created utils to time functions
+from background import CoalescingExecutor
+from preprocess import LazyDataFrames, add_quantile_tables, add_player_tables, add_series_tables, lookup_percentiles, compute_season_series
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
+from plotly.colors import qualitative
+import flask
 import os
+import sys
 import base64
 import random
+import threading
 import dash_bootstrap_components as dbc
 
+# numpy and pandas are only imported when they are used for the first time
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
+# fast start: the tables are loaded on first use or in the background once the server listens
+FAST_START = "--fast-start" in sys.argv or os.environ.get("FAST_START") == "1"
+# diagnostics: memory and allocation reports served under /_diagnostics/
+DIAGNOSTICS = "--diagnostics" in sys.argv or os.environ.get("DIAGNOSTICS") == "1"
+# background: the figure callbacks run in a thread pool, identical concurrent requests share one computation
+BACKGROUND = "--background" in sys.argv or os.environ.get("BACKGROUND") == "1"
+BACKGROUND_WORKERS = int(os.environ.get("BACKGROUND_WORKERS", "4"))
+HOST = os.environ.get("HOST", "127.0.0.1")
+PORT = int(os.environ.get("PORT", "8050"))
+
+startup_timer.mark("import")
+
+# comparison page: metric: (table, column, aggregation of the rows of a season, title)
+COMPARISON_METRICS = {
+    "goals": ("shooting", "goals", "sum", "Goals"),
+    "assists": ("passing", "assists", "sum", "Assists"),
+    "tackles": ("defense", "tackles", "sum", "Tackles"),
+    "cards": ("misc", "cards", "sum", "Cards"),
+    "clean_sheets": ("keeper", "clean_sheets", "sum", "Clean sheets"),
+    "save_pct": ("keeper", "save_pct", "mean", "Save percentage"),
+}
+
+all_df = LazyDataFrames("out/")
+add_quantile_tables(all_df)  # <table>_quantiles lookup tables for the percentile overlays
+add_player_tables(all_df)  # players, player_clubs and player_ids tables for the sidebar
+# <table>_by_id tables for the comparison page
+add_series_tables(all_df, {metric: spec[:3] for metric, spec in COMPARISON_METRICS.items()})
+if not FAST_START:
+    all_df.load_all()
+
+startup_timer.mark("load")
 
 app = Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP, dbc.icons.BOOTSTRAP])
 
+figures = CoalescingExecutor(max_workers=BACKGROUND_WORKERS, enabled=BACKGROUND)
+
 # assume you have a "long-form" data frame
 # see https://plotly.com/python/px-arguments/ for more options
 
-all_df = get_all_dataframes("out/")
-
 # colors: https://plotly.com/python/builtin-colorscales/
-TEAMS_COLORS = px.colors.qualitative.Prism
+TEAMS_COLORS = qualitative.Prism
+
+MAX_COMPARED_PLAYERS = 30
+COMPARISON_TRACES = 8  # above, the last selected players are merged into one median line
 
 def unify_legend(fig):
     """
@@ -35,6 +77,37 @@ def unify_legend(fig):
             if (trace.name in names) else names.add(trace.name))
 
 
+def add_percentile_overlay(fig, player_df, player_id, table, column, **trace_kwargs):
+    """
+        Adds a dashed line with the median of the player's position, season and competition level
+        The player's percentile of every season is written on the line
+    """
+    if player_id not in all_df["players"].index or len(player_df) == 0:
+        return
+    rows = player_df.assign(general_position=all_df["players"].at[player_id, "general_position"])
+    medians, percentiles = lookup_percentiles(all_df[f"{table}_quantiles"], rows, column)
+    fig.add_trace(
+        go.Scatter(
+            name="Position median",
+            x=player_df["season"].tolist(),
+            y=medians.tolist(),
+            text=["" if np.isnan(pct) else f"P{pct:.0f}" for pct in percentiles],
+            mode="lines+markers+text",
+            textposition="top center",
+            line=dict(dash="dash", color="#6c757d"),
+            hovertemplate="Median: %{y}<br>Percentile: %{text}<extra></extra>",
+        ),
+        **trace_kwargs
+    )
+
+
+def show_percentiles(overlays):
+    """
+        Returns True if the percentile overlay is checked
+    """
+    return bool(overlays) and "percentiles" in overlays
+
+
 @time_this
 @app.callback(
     Output('player_dropdown', 'value'),
@@ -47,8 +120,8 @@ def update_dropdowns(position, all_positions):
         Updates the players dropdown depending on the selected position
     """
     if position == "All":
-        all_positions.remove(position)  # All is an self added position, it isn't in the database
-        players = all_df["info"].sort_values("name")["name"].loc[all_df["info"]["general_position"].isin(all_positions)].unique()
+        positions = [p for p in all_positions if p != position]  # All is an self added position, it isn't in the database
+        players = all_df["info"].sort_values("name")["name"].loc[all_df["info"]["general_position"].isin(positions)].unique()
     else:
         players = all_df["info"].sort_values("name")["name"].loc[all_df["info"]["general_position"] == position].unique()
     player = players[0]
@@ -60,12 +133,10 @@ def get_id_from_name(player_name):
     """
         Utility method to get the id of a player from his name
     """
-    ids = all_df["info"]["id"]
-    names = all_df["info"]["name"]
-    for i in range (0, np.size(names)):
-        if names[i] == player_name:
-            return ids[i]
-    raise ValueError(f"{player_name} is not a valid player")
+    try:
+        return all_df["player_ids"].at[player_name, "id"]
+    except KeyError:
+        raise ValueError(f"{player_name} is not a valid player")
 
 
 @time_this
@@ -73,10 +144,10 @@ def get_name_from_id(player_id):
     """
         Utility method to get the name of a player from his id
     """
-    player_row = all_df["info"].loc[all_df["info"]["id"] == player_id]
-    if len(player_row) == 0:
+    try:
+        return all_df["players"].at[player_id, "name"]
+    except KeyError:
         raise ValueError(f"{player_id} is not a valid player")
-    return player_row.iloc[0]["name"]
 
 
 def get_team_colors(teams):
@@ -94,8 +165,10 @@ def get_team_colors(teams):
 @app.callback(
     Output('plot_player_goals', 'figure'),
     Input('player_dropdown', 'value'),
+    Input('overlay_toggle', 'value'),
 )
-def plot_player_goals(player_name):
+@figures.background
+def plot_player_goals(player_name, overlays=None):
     """
         Returns the figure comparing the scored goals with the scoring percentage
         Note: The scoring percentage is defined by the number of goals per shot on target
@@ -130,6 +203,8 @@ def plot_player_goals(player_name):
                         secondary_y = True,
                 )
                 idx_change_of_teams = i
+        if show_percentiles(overlays):
+            add_percentile_overlay(fig, player_df, player_id, "shooting", "goals", secondary_y=False)
         fig.update_xaxes(title_text = "Season", fixedrange=True)  # fixedrange avoid unwanted zooming
         fig.update_yaxes(title_text = "Goals", secondary_y = False, fixedrange=True)
         fig.update_yaxes(title_text = "Percentage", secondary_y = True, fixedrange=True)
@@ -153,8 +228,10 @@ def plot_player_goals(player_name):
 @app.callback(
     Output('plot_a_player_cards_seasons', 'figure'),
     Input('player_dropdown', 'value'),
+    Input('overlay_toggle', 'value'),
 )
-def plot_a_player_cards_seasons(player_name):
+@figures.background
+def plot_a_player_cards_seasons(player_name, overlays=None):
     """
         Returns the figure showing the amount of yellow & red cards gotten by the player throughout the seasons
     """
@@ -180,6 +257,8 @@ def plot_a_player_cards_seasons(player_name):
             },
         )
     )
+    if show_percentiles(overlays):
+        add_percentile_overlay(fig, player_misc_df, player_id, "misc", "cards_yellow")
     fig.update_xaxes(fixedrange=True)
     fig.update_yaxes(fixedrange=True)
     return fig
@@ -189,15 +268,16 @@ def plot_a_player_cards_seasons(player_name):
 @app.callback(
     Output('plot_a_player_fouls_cards_seasons', 'figure'),
     Input('player_dropdown', 'value'),
+    Input('overlay_toggle', 'value'),
 )
-def plot_a_player_fouls_cards_seasons(player_name):
+@figures.background
+def plot_a_player_fouls_cards_seasons(player_name, overlays=None):
     """
         Returns the figure comparing the amount of fouls that the player did and
         the amount of cards that he got
     """
     player_id = get_id_from_name(player_name)
-    player_misc_df = all_df["misc"].loc[all_df["misc"]["id"] == player_id]
-    player_misc_df["cards"] = player_misc_df["cards_red"] + player_misc_df["cards_yellow"]
+    player_misc_df = all_df["misc"].loc[all_df["misc"]["id"] == player_id]  # cards is computed when the table is loaded
     button_layer_1_height = 1.08
     fig = go.Figure(
         data=[
@@ -217,6 +297,8 @@ def plot_a_player_fouls_cards_seasons(player_name):
             },
         )
     )
+    if show_percentiles(overlays):
+        add_percentile_overlay(fig, player_misc_df, player_id, "misc", "fouls")
     fig.update_xaxes(fixedrange=True)
     fig.update_yaxes(fixedrange=True)
     return fig
@@ -233,10 +315,10 @@ def get_player_weight_height(player_name):
     """
         Returns the weight, the height and the specific position of a player
     """
-    player_row = all_df["info"].loc[all_df['info']['name'] == player_name]
-    height = player_row.iloc[0]["height"]
-    weight = player_row.iloc[0]["weight"]
-    position = player_row.iloc[0]['position']
+    player = all_df["players"].loc[get_id_from_name(player_name)]
+    height = player["height"]
+    weight = player["weight"]
+    position = player['position']
     return f"Height: {height} cm", f"Weight: {weight} kg", f"Position: {position}"
 
 
@@ -245,21 +327,21 @@ def get_player_weight_height(player_name):
     Output('plot_a_player_clubs_seasons', 'figure'),
     Input('player_dropdown', 'value'),
 )
+@figures.background
 def get_player_club_evolution(player_name):
     """
         Returns a pie chart showing every club the player has played in during his career
     """
     player_id = get_id_from_name(player_name)
-    player_misc_df = all_df["misc"].loc[all_df["misc"]["id"] == player_id]
+    player_clubs = all_df["player_clubs"]
+    clubs = player_clubs.loc[[player_id]] if player_id in player_clubs.index else player_clubs.iloc[:0]
     figure = go.Figure()
-    unique_teams = np.unique(player_misc_df["squad"], return_counts = True)
-    teams = player_misc_df["squad"]
     figure.add_trace(
         go.Pie(
-            labels=unique_teams[0],
-            values=unique_teams[1],
+            labels=clubs["squad"].tolist(),
+            values=clubs["seasons"].tolist(),
             textinfo='label+percent',
-            marker=dict(colors=[TEAMS_COLORS[i] for i in range(0, len(unique_teams[0]))])
+            marker=dict(colors=[TEAMS_COLORS[i] for i in range(0, len(clubs))])
         )
     )
     figure.update_layout(
@@ -275,12 +357,45 @@ def get_player_club_evolution(player_name):
     return figure
 
 
+def format_stat(value, decimals=0):
+    """
+        Formats a career stat, missing values are shown as a dash
+    """
+    return "-" if pd.isna(value) else f"{value:.{decimals}f}"
+
+
+@time_this
+@app.callback(
+    Output('career_summary', 'children'),
+    Input('player_dropdown', 'value'),
+)
+def get_player_career(player_name):
+    """
+        Returns the career summary of a player: seasons, clubs and career totals
+    """
+    player = all_df["players"].loc[get_id_from_name(player_name)]
+    lines = [
+        f"Seasons: {format_stat(player['seasons'])} ({player['first_season']} to {player['last_season']})",
+        f"Clubs: {format_stat(player['clubs'])}",
+        f"Games: {format_stat(player['games'])} ({format_stat(player['minutes_per_game'])} min/game)",
+    ]
+    if "G" in str(player["general_position"]):  # same shortcut as the keeper page
+        lines.append(f"Clean sheets: {format_stat(player['clean_sheets'])}")
+    else:
+        lines.append(f"Goals: {format_stat(player['goals'])} ({format_stat(player['goals_per_game'], 2)}/game)")
+        lines.append(f"Assists: {format_stat(player['assists'])} ({format_stat(player['assists_per_game'], 2)}/game)")
+    lines.append(f"Cards: {format_stat(player['cards_yellow'])} yellow, {format_stat(player['cards_red'])} red")
+    return [html.Div(line) for line in lines]
+
+
 @time_this
 @app.callback(
     Output('plot_player_games_played', 'figure'),
     Input('player_dropdown', 'value'),
+    Input('overlay_toggle', 'value'),
 )
-def plot_player_games_played(player_name):
+@figures.background
+def plot_player_games_played(player_name, overlays=None):
     """
         Returns the figure showing the number of games played by a certain player
         and the average minutes he played per game
@@ -315,6 +430,8 @@ def plot_player_games_played(player_name):
                         secondary_y = True,
                 )
                 idx_change_of_teams = i
+        if show_percentiles(overlays):
+            add_percentile_overlay(fig, player_df, player_id, "playing_time", "games", secondary_y=False)
         fig.update_xaxes(title_text = "Season", fixedrange=True)
         fig.update_yaxes(title_text = "Games played", secondary_y = False, fixedrange=True)
         fig.update_yaxes(title_text = "Minutes/game", secondary_y = True, fixedrange=True)
@@ -338,8 +455,10 @@ def plot_player_games_played(player_name):
 @app.callback(
     Output('plot_a_player_tackles', 'figure'),
     Input('player_dropdown', 'value'),
+    Input('overlay_toggle', 'value'),
 )
-def get_player_tackles(player_name):
+@figures.background
+def get_player_tackles(player_name, overlays=None):
     """
         Returns the figure comparing all the tackles of a player
         to the ones that he won
@@ -370,6 +489,8 @@ def get_player_tackles(player_name):
                 )
             )
             idx_change_of_teams = i
+    if show_percentiles(overlays):
+        add_percentile_overlay(fig, player_def_df, player_id, "defense", "tackles")
     fig.update_xaxes(title_text = "Season", fixedrange=True)
     fig.update_yaxes(title_text = "Number of Tackles", fixedrange=True)
     fig.update_layout(
@@ -389,9 +510,11 @@ def get_player_tackles(player_name):
 @time_this
 @app.callback(
     Output('plot_a_player_assists', 'figure'),
-    Input('player_dropdown', 'value')
+    Input('player_dropdown', 'value'),
+    Input('overlay_toggle', 'value'),
 )
-def get_player_assists(player_name):
+@figures.background
+def get_player_assists(player_name, overlays=None):
     """
         Returns the figure comparing the number of passes of player did
         to the number of assists that he did
@@ -432,6 +555,8 @@ def get_player_assists(player_name):
                 ),secondary_y = True,
             )
             idx_change_of_teams = i
+    if show_percentiles(overlays):
+        add_percentile_overlay(fig, player_pass_df, player_id, "passing", "passes", secondary_y=False)
     fig.update_xaxes(title_text = "Season", fixedrange=True)
     fig.update_yaxes(title_text = "Number of passes",secondary_y = False, fixedrange=True)
     fig.update_yaxes(title_text = "Number of assists",secondary_y = True, fixedrange=True)
@@ -449,7 +574,7 @@ def get_player_assists(player_name):
     return fig
 
 
-def plot_gk(player_name, category="clean sheets"):
+def plot_gk(player_name, category="clean sheets", overlays=None):
     """
         Keeper graphs method
         Returns the keeper figure corresponding to the category passed as parameter
@@ -498,6 +623,8 @@ def plot_gk(player_name, category="clean sheets"):
                 ),secondary_y = True,
             )
             idx_change_of_teams = i
+    if show_percentiles(overlays):
+        add_percentile_overlay(fig, player_df, player_id, "keeper", column, secondary_y=False)
     fig.update_xaxes(title_text = "Season", fixedrange=True)
     fig.update_yaxes(title_text = yaxes, secondary_y = False, fixedrange=True)
     fig.update_yaxes(title_text = yaxes2, secondary_y = True, fixedrange=True)
@@ -518,37 +645,109 @@ def plot_gk(player_name, category="clean sheets"):
 @time_this
 @app.callback(
     Output('plot_clean_sheets', 'figure'),
-    Input('player_dropdown', 'value')
+    Input('player_dropdown', 'value'),
+    Input('overlay_toggle', 'value'),
 )
-def plot_clean_sheets(player_name):
+@figures.background
+def plot_clean_sheets(player_name, overlays=None):
     """
         complementary function for plot_gk in order for the callback to work properly
     """
-    return plot_gk(player_name, 'clean sheets')
+    return plot_gk(player_name, 'clean sheets', overlays)
 
 
 @time_this
 @app.callback(
     Output('plot_saves', 'figure'),
-    Input('player_dropdown', 'value')
+    Input('player_dropdown', 'value'),
+    Input('overlay_toggle', 'value'),
 )
-def plot_saves(player_name):
+@figures.background
+def plot_saves(player_name, overlays=None):
     """
         complementary function for plot_gk in order for the callback to work properly
     """
-    return plot_gk(player_name, 'saves')
+    return plot_gk(player_name, 'saves', overlays)
 
 
 @time_this
 @app.callback(
     Output('plot_penalties', 'figure'),
-    Input('player_dropdown', 'value')
+    Input('player_dropdown', 'value'),
+    Input('overlay_toggle', 'value'),
 )
-def plot_penalties(player_name):
+@figures.background
+def plot_penalties(player_name, overlays=None):
     """
         complementary function for plot_gk in order for the callback to work properly
     """
-    return plot_gk(player_name, 'penalties')
+    return plot_gk(player_name, 'penalties', overlays)
+
+
+@time_this
+@app.callback(
+    [Output(f'compare_{metric}', 'figure') for metric in COMPARISON_METRICS],
+    Input('compare_players', 'value'),
+)
+@figures.background
+def plot_comparison(player_names):
+    """
+        Returns one figure per comparison metric with the season series of every selected player
+        The rows of all the players are selected at once, from the 8th player on the series
+        are merged into their median so that the figures keep a fixed number of traces
+    """
+    player_names = (player_names or [])[:MAX_COMPARED_PLAYERS]
+    player_ids = all_df["player_ids"].reindex(player_names)["id"].dropna().tolist()
+    series = compute_season_series(
+        all_df, player_ids, {metric: spec[:3] for metric, spec in COMPARISON_METRICS.items()}
+    )
+    names = all_df["players"]["name"].reindex(player_ids).tolist()
+    comparison_figures = []
+    for metric, (_, _, _, title) in COMPARISON_METRICS.items():
+        fig = go.Figure()
+        season_df = series[metric]
+        if len(player_ids) > COMPARISON_TRACES:
+            shown = COMPARISON_TRACES - 1
+            traces = list(zip(names[:shown], season_df.iloc[:, :shown].items()))
+            traces.append((f"Median of {len(player_ids) - shown} others", (None, season_df.iloc[:, shown:].median(axis=1))))
+        else:
+            traces = list(zip(names, season_df.items()))
+        for cnt, (name, (_, values)) in enumerate(traces):
+            fig.add_trace(
+                go.Scatter(
+                    name=name,
+                    x=season_df.index.tolist(),
+                    y=values.tolist(),
+                    mode="lines+markers",
+                    marker_color=TEAMS_COLORS[cnt % len(TEAMS_COLORS)],
+                )
+            )
+        fig.update_xaxes(title_text="Season", fixedrange=True)
+        fig.update_yaxes(title_text=title, fixedrange=True)
+        fig.update_layout(
+            legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1),
+            paper_bgcolor='#f8f9fa',
+            font={
+                "size": 12,
+                "color": "black"
+            },
+        )
+        comparison_figures.append(fig)
+    return comparison_figures
+
+
+@app.callback(
+    Output('compare_limit', 'children'),
+    Input('compare_players', 'value'),
+)
+def show_ignored_players(player_names):
+    """
+        Tells which selected players are not compared, plot_comparison only keeps the first MAX_COMPARED_PLAYERS
+    """
+    ignored = (player_names or [])[MAX_COMPARED_PLAYERS:]
+    if not ignored:
+        return ""
+    return f"Only the first {MAX_COMPARED_PLAYERS} players are compared, ignored: {', '.join(ignored)}"
 
 
 @app.callback(
@@ -581,6 +780,44 @@ def create_card(title, graph_id):
     ], className="mb-4", style={"background-color":"#f8f9fa"})
 
 
+def create_comparison_page():
+    """
+        Returns the page comparing the season series of several players
+    """
+    players = all_df["info"].sort_values("name")["name"].unique()
+    metric_cards = [
+        dbc.Col([create_card(title, f"compare_{metric}")], width=6)
+        for metric, (_, _, _, title) in COMPARISON_METRICS.items()
+    ]
+    return html.Div(children=[
+        html.Div([
+            dcc.Link(
+                [
+                    html.I(className="bi bi-house-door-fill fa-8x", style={"margin-left":"2%", "font-size": "30px", "color":"white"}),
+                    html.H1(children='Soccer Statistics', className="header-title")
+                ], className="link d-flex align-items-center", href="/")
+        ], className="second_header"),
+        html.Div(
+            [
+                html.H3("Compare players"),
+                html.Hr(),
+                html.P(f"Choose up to {MAX_COMPARED_PLAYERS} players"),
+                dcc.Dropdown(
+                    players,
+                    list(players[:2]),
+                    id="compare_players",
+                    multi=True,
+                    placeholder="Select players"
+                ),
+                html.P(id="compare_limit", className="text-danger mt-2"),
+            ], className="sidebar"
+        ),
+        html.Div([
+            dbc.Row(metric_cards[i:i + 2]) for i in range(0, len(metric_cards), 2)
+        ], className="content")
+    ])
+
+
 # modify Pages
 @app.callback(
     Output('page-content', 'children'),
@@ -604,6 +841,7 @@ def display_page(pathname):
                 ], className="header-description"),
             ], className="header"),
             html.H3(id="select_position_title", children='Select the position you are looking for'),
+            html.H5(dcc.Link("or compare players season by season", href="/compare"), id="compare_link"),
             html.Div(
                 children=[
                     # https://community.plotly.com/t/how-to-embed-images-into-a-dash-app/61839
@@ -621,6 +859,8 @@ def display_page(pathname):
                 ]
                 ),
         ])
+    elif pathname == "/compare":
+        return create_comparison_page()
     else:
 
         position_shortcuts = {"/midfielder": "M", "/keeper": "G", "/defender": "D", "/striker": "A|FW"}
@@ -739,6 +979,15 @@ def display_page(pathname):
                         html.Span(id="position"),
                     ], style={"margin-top": "1rem"}),
 
+                    html.Div(id="career_summary", style={"margin-top": "1rem"}),
+
+                    dcc.Checklist(
+                        id="overlay_toggle",
+                        options={"percentiles": " Compare to the position median"},
+                        value=[],
+                        style={"margin-top": "1rem"},
+                    ),
+
                     graph_type,
                     html.Div(
                         [
@@ -770,5 +1019,59 @@ app.layout = html.Div([
     html.Div(id='page-content'),
 ])
 
+startup_timer.mark("layout")
+
+
+@app.server.route("/_ready")
+def ready():
+    """
+        Readiness signal: 200 once every table is loaded, 503 while some are still pending
+    """
+    status = {
+        "ready": all_df.ready.is_set(),
+        "pending": all_df.pending(),
+        "startup": startup_timer.phases,
+        "tables": all_df.load_times,
+    }
+    return flask.jsonify(status), 200 if status["ready"] else 503
+
+
+if DIAGNOSTICS:
+    import diagnostics
+    diagnostics.add_routes(app, all_df, sys.modules[__name__])
+
+    def copy_under_lock(mapping):
+        """
+            The executor threads modify the dictionaries of figures, they are copied under its lock
+        """
+        with figures.lock:
+            return dict(mapping)
+
+    diagnostics.register_cache("background figures (in flight)", lambda: copy_under_lock(figures.in_flight))
+    diagnostics.register_cache("background figures (latest per client)", lambda: copy_under_lock(figures.latest))
+
+
+def print_startup_times():
+    """
+        Prints the startup breakdown and the load time of every table loaded so far
+    """
+    print(startup_timer.report(all_df.load_times))
+
+
+def warm_up(host, port):
+    """
+        Waits for the server to listen, then imports the heavy modules and loads every table
+    """
+    wait_for_port(host, port)
+    np.ndarray, pd.DataFrame  # first attribute access imports the modules
+    all_df.load_all()
+    if "--startup-times" in sys.argv:
+        print_startup_times()
+
+
 if __name__ == '__main__':
-    app.run_server(debug=False, threaded=True)
\ No newline at end of file
+    if "--startup-times" in sys.argv:
+        print_startup_times()
+    if FAST_START:
+        threading.Thread(target=warm_up, args=(HOST, PORT), daemon=True).start()
+    app.run_server(host=HOST, port=PORT, debug=False, threaded=True)
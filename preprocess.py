@@ -1,14 +1,323 @@
-import pandas as pd
 import glob
+import hashlib
+import os
 import platform
+import tempfile
+import threading
+import time
+from collections.abc import Mapping
+from utils import lazy_import
 
-def get_all_dataframes(path):
+pd = lazy_import("pandas")
+np = lazy_import("numpy")
+
+# quantiles stored for every (general_position, season, comp_level) group, 5% steps
+QUANTILES = [i / 20 for i in range(21)]
+QUANTILE_KEYS = ["general_position", "season", "comp_level"]
+QUANTILE_COLUMNS = {
+    "misc": ["cards_yellow", "cards_red", "fouls"],
+    "defense": ["tackles", "tackles_won"],
+    "keeper": ["clean_sheets", "clean_sheets_pct", "shots_on_target_against", "save_pct", "pens_att_gk", "pens_save_pct"],
+    "passing": ["passes", "assists"],
+    "playing_time": ["games", "minutes_per_game"],
+    "shooting": ["goals", "goals_per_shot_on_target"],
+}
+
+
+def get_csv_files(path):
     os_char = {'Linux': '/', 'Darwin': '/', 'Windows': '\\'}
-    all_df = {}
+    csv_files = {}
     for filename in glob.glob(f"{path}*.csv"):
         name = filename.split(os_char[platform.system()])[1].split(".")[0]
-        all_df[name] = pd.read_csv(filename)
-    return all_df
+        csv_files[name] = filename
+    return csv_files
+
+
+def get_all_dataframes(path):
+    return {name: pd.read_csv(filename) for name, filename in get_csv_files(path).items()}
+
+
+# columns computed once when a table is read, so that the callbacks never have to add them
+DERIVED_COLUMNS = {
+    "misc": {"cards": lambda df: df["cards_red"] + df["cards_yellow"]},
+}
+
+
+def freeze_dataframe(df):
+    """
+        Returns a copy of the dataframe whose numeric values are read-only, modifying them in place raises a ValueError
+        The copy is consolidated (one block per dtype), so pandas never replaces a frozen block by a writable one later.
+        Object columns (strings) stay writable: pandas cannot compare read-only object arrays.
+        Replacing a whole column (df[column] = ...) is not prevented either, the shared tables must only be read
+    """
+    df = df.copy()  # the copy is consolidated
+    for values in df._mgr.arrays:  # backing arrays of the blocks
+        if isinstance(values, np.ndarray) and values.dtype != object:
+            values.flags.writeable = False
+    for column, dtype in df.dtypes.items():
+        if dtype != object and df[column].to_numpy().flags.writeable:
+            raise RuntimeError(f"Column {column} could not be made read-only")
+    return df
+
+
+class LazyDataFrames(Mapping):
+    """
+        Read-only snapshot of the dataframes of a folder
+        Every csv is only read when the table is used for the first time,
+        derived tables are built from the other tables when they are first used.
+        The tables are frozen once loaded so they can be shared by callbacks running in parallel,
+        see freeze_dataframe for what is (and is not) protected
+    """
+    def __init__(self, path):
+        self.path = path
+        self.version = get_dataset_version(path)
+        self.files = get_csv_files(path)
+        self.builders = {}
+        self.load_times = {}
+        self.ready = threading.Event()
+        self._tables = {}
+        self._locks = {name: threading.Lock() for name in self.files}
+
+    def add_derived(self, name, builder):
+        """
+            Registers a table computed by builder(all_df) on first use
+        """
+        self.builders[name] = builder
+        self._locks[name] = threading.Lock()
+        self.ready.clear()
+
+    def __getitem__(self, name):
+        if name not in self._tables:
+            with self._locks[name]:  # unknown tables raise a KeyError here
+                if name not in self._tables:
+                    start = time.perf_counter()
+                    if name in self.builders:
+                        table = self.builders[name](self)
+                    else:
+                        table = pd.read_csv(self.files[name]).assign(**DERIVED_COLUMNS.get(name, {}))
+                    self.load_times[name] = time.perf_counter() - start
+                    self._tables[name] = freeze_dataframe(table)
+        return self._tables[name]
+
+    def __contains__(self, name):
+        return name in self._locks  # Mapping would load the table to answer
+
+    def __iter__(self):
+        return iter(list(self._locks))
+
+    def __len__(self):
+        return len(self._locks)
+
+    def pending(self):
+        """
+            Returns the names of the tables that are not loaded yet
+        """
+        return [name for name in self if name not in self._tables]
+
+    def load_all(self):
+        """
+            Loads every table and sets the ready event
+        """
+        for name in self:
+            self[name]
+        self.ready.set()
+
+
+def get_dataset_version(path):
+    """
+        Fingerprint of the csv files of a dataset (name, size and modification time)
+        Changes whenever one of the files is regenerated
+    """
+    fingerprint = hashlib.sha1()
+    for filename in sorted(glob.glob(f"{path}*.csv")):
+        stat = os.stat(filename)
+        fingerprint.update(f"{os.path.basename(filename)}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+    return fingerprint.hexdigest()[:12]
+
+
+def compute_quantile_table(stat_df, info_df, columns):
+    """
+        Computes the quantiles of the given columns for every position, season and competition level
+        The result is indexed by QUANTILE_KEYS and has a (column, quantile) column index
+    """
+    positions = info_df[["id", "general_position"]].drop_duplicates("id")
+    df = stat_df[["id", "season", "comp_level"] + columns].merge(positions, on="id", how="inner")
+    table = df.groupby(QUANTILE_KEYS)[columns].quantile(QUANTILES).unstack(level=-1)
+    table.columns.names = ["column", "quantile"]
+    return table
+
+
+def get_quantile_table(all_df, name):
+    """
+        Returns the quantile lookup table of a stat table
+        The table is computed once per dataset version and cached next to the csv files,
+        an unreadable cache file (e.g. interrupted write) is recomputed
+    """
+    cache_dir = os.path.join(all_df.path, ".cache")
+    cache_file = os.path.join(cache_dir, f"{name}_quantiles-{all_df.version}.pkl")
+    if os.path.exists(cache_file):
+        try:
+            return pd.read_pickle(cache_file)
+        except Exception:
+            pass
+    table = compute_quantile_table(all_df[name], all_df["info"], QUANTILE_COLUMNS[name])
+    os.makedirs(cache_dir, exist_ok=True)
+    # written next to the final file then renamed, so other processes never read a partial pickle
+    fd, tmp_file = tempfile.mkstemp(dir=cache_dir, prefix=f".{name}_quantiles-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as tmp:
+            table.to_pickle(tmp)
+        os.replace(tmp_file, cache_file)
+    except OSError:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        return table
+    for old_file in glob.glob(os.path.join(cache_dir, f"{name}_quantiles-*.pkl")):
+        if old_file != cache_file:  # tables of previous dataset versions
+            try:
+                os.remove(old_file)
+            except OSError:
+                pass
+    return table
+
+
+def add_quantile_tables(all_df):
+    """
+        Registers the <table>_quantiles lookup tables of every stat table
+    """
+    for name in QUANTILE_COLUMNS:
+        if name in all_df:
+            all_df.add_derived(f"{name}_quantiles", lambda tables, name=name: get_quantile_table(tables, name))
+
+
+def lookup_percentiles(quantile_table, rows, column):
+    """
+        Returns the medians of the rows' groups and the percentile of each row's value within its group
+        A value equal to several quantiles (e.g. the 0 goals of most defenders) gets the middle of their
+        range, np.interp alone would give the top of it. Rows whose group is unknown get NaN
+    """
+    group_quantiles = quantile_table[column].reindex(pd.MultiIndex.from_frame(rows[QUANTILE_KEYS])).to_numpy()
+    medians = group_quantiles[:, QUANTILES.index(0.5)]
+    steps = np.array(QUANTILES) * 100
+    percentiles = np.full(len(rows), np.nan)
+    for i, (value, quantiles) in enumerate(zip(rows[column].to_numpy(), group_quantiles)):
+        if not (np.isnan(value) or np.isnan(quantiles).any()):
+            from_right = np.interp(value, quantiles, steps)  # last of the tied quantiles
+            from_left = -np.interp(-value, -quantiles[::-1], -steps[::-1])  # first of the tied quantiles
+            percentiles[i] = (from_left + from_right) / 2
+    return medians, percentiles
+
+
+# career totals of the player summary, by stat table
+CAREER_TOTALS = {
+    "playing_time": ["games", "minutes"],
+    "shooting": ["goals", "shots_on_target"],
+    "passing": ["passes", "assists"],
+    "defense": ["tackles", "tackles_won"],
+    "misc": ["fouls", "cards_yellow", "cards_red", "cards"],
+    "keeper": ["clean_sheets", "shots_on_target_against"],
+}
+
+
+def get_player_seasons(all_df):
+    """
+        Returns every (id, season, squad) found in the stat tables
+    """
+    return pd.concat(
+        [all_df[name][["id", "season", "squad"]] for name in CAREER_TOTALS if name in all_df]
+    ).drop_duplicates()
+
+
+def compute_player_summary(all_df):
+    """
+        Computes one row per player, indexed by id: info columns, career totals,
+        seasons played, number of clubs, first/last season and ratios derived from the totals
+    """
+    summary = all_df["info"].drop_duplicates("id").set_index("id")[["name", "general_position", "position", "height", "weight"]]
+    player_seasons = get_player_seasons(all_df)
+    career = player_seasons.groupby("id").agg(
+        seasons=("season", "nunique"),
+        first_season=("season", "min"),
+        last_season=("season", "max"),
+        clubs=("squad", "nunique"),
+    )
+    totals = [
+        all_df[name].groupby("id")[columns].sum(min_count=1)
+        for name, columns in CAREER_TOTALS.items() if name in all_df
+    ]
+    summary = summary.join([career] + totals)
+    games = summary["games"].where(summary["games"] > 0)
+    return summary.assign(
+        minutes_per_game=summary["minutes"] / games,
+        goals_per_game=summary["goals"] / games,
+        assists_per_game=summary["assists"] / games,
+        cards_per_game=summary["cards"] / games,
+        goals_per_shot_on_target=summary["goals"] / summary["shots_on_target"].where(summary["shots_on_target"] > 0),
+        tackles_won_pct=100 * summary["tackles_won"] / summary["tackles"].where(summary["tackles"] > 0),
+    )
+
+
+def compute_player_clubs(all_df):
+    """
+        Computes the number of seasons played in every club, indexed by player id
+    """
+    return get_player_seasons(all_df).groupby(["id", "squad"])["season"].nunique().rename("seasons").reset_index("squad")
+
+
+def add_player_tables(all_df):
+    """
+        Registers the per player tables:
+        players (career summary indexed by id), player_clubs (seasons per club) and player_ids (id indexed by name)
+    """
+    all_df.add_derived("players", compute_player_summary)
+    all_df.add_derived("player_clubs", compute_player_clubs)
+    all_df.add_derived("player_ids", lambda tables: tables["info"].drop_duplicates("name").set_index("name")[["id"]])
+
+
+def add_series_tables(all_df, metrics):
+    """
+        Registers the <table>_by_id tables read by compute_season_series:
+        the season and the metric columns of every table of metrics, indexed by the sorted player ids
+    """
+    columns = {}
+    for table, column, _ in metrics.values():
+        columns.setdefault(table, {"season": None})[column] = None
+    for name, table_columns in columns.items():
+        all_df.add_derived(
+            f"{name}_by_id",
+            lambda tables, name=name, table_columns=list(table_columns): (
+                tables[name].set_index("id")[table_columns].sort_index(kind="stable")
+            ),
+        )
+
+
+def compute_season_series(all_df, player_ids, metrics):
+    """
+        Computes the season series of several players for several metrics
+        metrics maps a name to (table, column, aggregation of the rows of a season), their tables
+        must be registered with add_series_tables. The rows of the players are found by binary
+        search in <table>_by_id, the cost grows with the selected rows and not with the table.
+        Returns {metric: dataframe indexed by season with one column per player id}
+    """
+    series = {}
+    tables = {}
+    for metric, (table, column, aggregation) in metrics.items():
+        tables.setdefault(table, []).append((metric, column, aggregation))
+    for table, table_metrics in tables.items():
+        df = all_df[f"{table}_by_id"]
+        ids = df.index.to_numpy()
+        starts, stops = ids.searchsorted(player_ids, "left"), ids.searchsorted(player_ids, "right")
+        positions = np.concatenate([np.arange(0)] + [np.arange(start, stop) for start, stop in zip(starts, stops)])
+        rows = df.iloc[positions]
+        grouped = rows.groupby(["season", "id"])
+        for metric, column, aggregation in table_metrics:
+            if aggregation == "sum":
+                values = grouped[column].sum(min_count=1)  # seasons without data stay missing
+            else:
+                values = grouped[column].agg(aggregation)
+            series[metric] = values.unstack("id").reindex(columns=player_ids)
+    return series
+
 
 def create_new_csv(name, df, columns):
     tmp_df = df[columns]
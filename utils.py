@@ -1,4 +1,8 @@
 import datetime
+import importlib
+import socket
+import time
+import types
 
 
 def time_this(func):
@@ -8,4 +12,62 @@ def time_this(func):
         end = datetime.datetime.now()
         print(f"Duration <<{func.__name__}>>: {end-start}")
         return data
-    return wrapper
\ No newline at end of file
+    return wrapper
+
+
+class LazyModule(types.ModuleType):
+    """
+        Stands for a module that is only imported when one of its attributes is used
+    """
+    def __getattr__(self, attr):
+        module = importlib.import_module(self.__name__)
+        self.__dict__.update(module.__dict__)
+        return getattr(module, attr)
+
+
+def lazy_import(name):
+    """
+        Returns a module that will be imported on first use
+    """
+    return LazyModule(name)
+
+
+class StartupTimer:
+    """
+        Measures the duration of the startup phases (import, load, layout)
+    """
+    def __init__(self):
+        self.last = time.perf_counter()
+        self.phases = {}
+
+    def mark(self, phase):
+        """
+            Ends the current phase, its duration is the time since the previous mark
+        """
+        now = time.perf_counter()
+        self.phases[phase] = self.phases.get(phase, 0) + now - self.last
+        self.last = now
+
+    def report(self, tables=None):
+        """
+            Returns the breakdown as text, tables are the load durations of the lazily loaded tables
+        """
+        lines = [f"{phase:<8} {duration:.3f}s" for phase, duration in self.phases.items()]
+        lines.append(f"{'total':<8} {sum(self.phases.values()):.3f}s")
+        for name, duration in (tables or {}).items():
+            lines.append(f"  table {name:<24} {duration:.3f}s")
+        return "\n".join(lines)
+
+
+def wait_for_port(host, port, timeout=30):
+    """
+        Waits until a server accepts connections on host:port, returns False on timeout
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=1):
+                return True
+        except OSError:
+            time.sleep(0.05)
+    return False